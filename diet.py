@@ -3,16 +3,64 @@
 import json
 import argparse
 import sys
-import random
-import csv
+import os
+import re
+import functools
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+# Parsed files are cached on (path, mtime, size) so they are only re-parsed
+# once they change on disk. Callers must not mutate the returned object.
+@functools.lru_cache(maxsize=8)
+def _loadCached(path, mtime, size):
+    with open(path, 'rb') as fp:
+        return _loads(fp.read())
+
+
+def _loadJson(path):
+    stat = os.stat(path)
+    return _loadCached(path, stat.st_mtime_ns, stat.st_size)
+
+
+# Writing to a temporary file first and swapping it in, so a crash mid-write
+# never leaves a truncated file behind
+def _writeJson(path, obj):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fp:
+        fp.write(_dumps(obj))
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+
+# Ingridient given on the command line: name,amount,unit
+_ING_RE = re.compile(r'^([^,]+),([^,]+),([^,]+)$')
+
+# Start of a JSON object, leading whitespace allowed
+_OBJECT_RE = re.compile(rb'\s*\{')
+
 
 class ingridient:
-    unit = None
-    amount = None
-    name = None
+    __slots__ = ('name', 'amount', 'unit')
 
     def __init__(self, name, amount, unit):
-        self.name = name.lower()
+        self.name = sys.intern(name.lower())
         self.amount = amount
         self.unit = unit
 
@@ -32,15 +80,13 @@ class ingridient:
         return {self.name:{'amount':self.amount*N, 'unit':self.unit}}
 
 class Course:
-
-    name = None
-    description = None
-    ingridients = {}
-    courseType = None
+    __slots__ = ('name', 'courseType', 'description', 'ingridients')
 
     def __init__(self, name, courseType):
         self.name = name.lower()
-        self.courseType = courseType.lower()
+        self.courseType = sys.intern(courseType.lower())
+        self.description = None
+        self.ingridients = {}
 
     def setDescription(self, description):
         self.description = description
@@ -48,109 +94,111 @@ class Course:
     def addIngridient(self, name, amount, unit):
         self.ingridients.update(ingridient(name, float(amount), unit).getIngridient())
 
+    def getCourse(self):
+        return {'description':self.description, 'ingridients':self.ingridients}
+
     def storeCourse(self):
-        course = {'description':self.description, 'ingridients':self.ingridients}
+        storeCourses([self])
+
+
+def storeCourses(new_courses):
+    # Reading and rewriting courses.json once for any number of courses
+    if not new_courses:
+        return
 
-        try:
-            fp = open("courses.json",'r')
-        except FileNotFoundError:
-            fp = open("courses.json", 'w+')
+    try:
+        fp = open("courses.json", 'rb')
+    except FileNotFoundError:
+        courses = {}
+    else:
+        data = fp.read()
+        fp.close()
 
-        try:
-            courses = json.load(fp)
-        except json.decoder.JSONDecodeError:
+        # Anything not starting with a JSON object (i.e. an empty file) holds
+        # no courses, so it is not handed to the parser at all
+        if _OBJECT_RE.match(data) is None:
             courses = {}
+        else:
+            try:
+                courses = _loads(data)
+            except json.decoder.JSONDecodeError:
+                courses = {}
 
-        if self.courseType not in courses:
-            courses[self.courseType] = {}
+    for course in new_courses:
+        dishes = courses.get(course.courseType)
+        if dishes is None:
+            dishes = courses[course.courseType] = {}
+        dishes[course.name] = course.getCourse()
 
-        courses[self.courseType][self.name] = course
+    _writeJson("courses.json", courses)
 
-        fp = open('courses.json', 'w')
-        json.dump(courses, fp)
-        fp.close()
 
+def scaleDish(dish, course_repeat):
+    return {'description': dish['description'],
+            'ingridients': {name: {'amount': data['amount']*course_repeat, 'unit': data['unit']}
+                            for name, data in dish['ingridients'].items()}}
+
+
+def randomize(number_of_dishes, course_repeat, seed=None):
+    import random
 
-def randomize(number_of_dishes, course_repeat):
     try:
-        fp = open('courses.json', 'r')
+        courses = _loadJson('courses.json')
     except FileNotFoundError:
         print('No courses file')
         sys.exit(1)
 
-    courses = json.load(fp)
-    
-    fp.close()
+    # Local generator instead of the module-level one, seeded for repeatable menus
+    rng = random.Random(seed)
 
     menu = {}
-    for course_type in courses:
+    for course_type, dishes in courses.items():
 
         # Initializing menu course type
-        menu[course_type] = {}
+        menu[course_type] = course_menu = {}
 
-        for n in range(number_of_dishes):
+        # Drawing distinct dishes for all days at once, so the same one is not
+        # randomized several times.
+        for dish in rng.sample(list(dishes), k=min(number_of_dishes, len(dishes))):
 
-            # Listing all dishes within one course type
-            dishes = list(courses[course_type].keys())
-            
-            # Drawing one dish out of all dishes
-            dish = random.choice(dishes)
+            # Updating menu for the next week, increasing repeats of single dish
+            # within i.e. breakfasts by course_repeat times in the same pass.
+            course_menu[dish] = scaleDish(dishes[dish], course_repeat)
 
-            # Updating menu for the next week
-            menu[course_type][dish] = courses[course_type][dish]
+    _writeJson('menu.json', menu)
 
-            # Increasing repeats of single dish within i.e. breakfasts by course_repeat times.
-            for ingridient in menu[course_type][dish]['ingridients']:
-                menu[course_type][dish]['ingridients'][ingridient]['amount'] = menu[course_type][dish]['ingridients'][ingridient]['amount']*course_repeat
-                 
-            # Deleting the dish to avoid randomizing the same one several times
-            del courses[course_type][dish]
+    return menu
 
-    fp = open('menu.json', 'w+')
-    json.dump(menu, fp)
-    fp.close()
+def prepareListOfIngridients(menu=None):
+    import csv
+    import itertools
 
-def prepareListOfIngridients():
-    fp = open('menu.json', 'r')
-    menu = json.load(fp)
-    ingridient_list = []
+    # Reading menu.json only when the menu was not handed over by randomize
+    if menu is None:
+        menu = _loadJson('menu.json')
 
     header = ['Ingridient', 'Amount', 'Unit']
 
-    # open the file in the write mode
-    f = open('list_of_ingridients.csv', 'w+')
-    
-    # create the csv writer
-    writer = csv.writer(f)
-    
-    # write a header to the csv file
-    writer.writerow(header)
-    
-    data = []
-
-    for course_type in menu:
-        for dish in menu[course_type]:
-            for ingridient in menu[course_type][dish]['ingridients']:
-
-                # we found ingridient to add to list!
-                # now we need to check if that type already exist!
-                found = False
-                for idx, item in enumerate(data):
-                    if ingridient in item:
-                        found = True
-                        break
-                    else:
-                        found = False
-
-                # If found then add additional amount
-                if found == True:
-                    item = [item[0], item[1] + menu[course_type][dish]['ingridients'][ingridient]['amount'], item[2]]
-                    data[idx] = item
+    # Aggregating amounts per ingridient name and unit, amounts given in
+    # different units cannot be summed up
+    agg = {}
+    get = agg.get
+
+    for dishes in menu.values():
+        for dish in dishes.values():
+            for name, data in dish['ingridients'].items():
+                key = (name, data['unit'])
+                row = get(key)
+                if row is not None:
+                    row[1] += data['amount']
                 else:
-                    data.append([ingridient, menu[course_type][dish]['ingridients'][ingridient]['amount'], menu[course_type][dish]['ingridients'][ingridient]['unit']])
-    writer.writerows(data)
-    f.close()    
+                    agg[key] = [name, data['amount'], data['unit']]
 
+    # Writing header and all rows to the csv file in a single call
+    f = open('list_of_ingridients.csv', 'w', newline='', buffering=1<<20)
+    writer = csv.writer(f)
+    writer.writerows(itertools.chain([header], agg.values()))
+    f.close()
 
 
 def main(args):
@@ -163,18 +211,21 @@ def main(args):
     parser.add_argument('-ing', nargs='+', help='Please type ingridients: [name,amount,unit] [...]', required=False)
     parser.add_argument('-ds', '--days', help='In case of randomizing please type amount of days')
     parser.add_argument('-cr', '--course_repeat', help='In case of randomizing, please type how many times one course should repeat')
+    parser.add_argument('-s', '--seed', type=int, help='In case of randomizing, optional seed to get the same menu again')
 
     args = parser.parse_args()
 
     if args.rORa == 'randomize':
-        randomize(int(args.days), int(args.course_repeat))
-        prepareListOfIngridients()
+        menu = randomize(int(args.days), int(args.course_repeat), args.seed)
+        prepareListOfIngridients(menu)
     elif args.rORa == 'add':
         course = Course(args.n, args.ct)
         course.setDescription(args.d)
         for ing in args.ing:
-            ing = ing.split(',')
-            course.addIngridient(ing[0], ing[1], ing[2])
+            match = _ING_RE.match(ing)
+            if match is None:
+                parser.error('ingridient should be given as name,amount,unit: %s' % ing)
+            course.addIngridient(*match.groups())
         course.storeCourse()
 
 